@@ -1,50 +1,218 @@
+import hashlib
 import os
 import sqlite3
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from flask import (
-    Flask, render_template, request, redirect, url_for,
-    flash, session, send_file, g
+    Flask, Request, render_template, request, redirect, url_for,
+    flash, session, send_file, make_response
 )
+from flask_caching import Cache
 from werkzeug.security import generate_password_hash, check_password_hash
 
+import utils
 from utils import (
     ensure_dir, random_filename, convert_office_to_pdf,
-    allowed_file, merge_pdfs, split_pdf
+    allowed_file, merge_pdfs, split_pdf, stream_to_disk,
+    stream_to_upload, parse_page_spec
 )
 
 # ------------------------------------------
 # CONFIG
 # ------------------------------------------
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
-UPLOAD_DIR = os.path.join(BASE_DIR, "uploads")
-CONVERTED_DIR = os.path.join(BASE_DIR, "converted")
+
+# Uploads and converted output are pure scratch: each file is written
+# once, read back once or twice, and served. Backing them with tmpfs
+# (/dev/shm) takes disk write bandwidth out of the critical path; hosts
+# without it (or with a dedicated tmpfs mount) can point the env vars
+# elsewhere.
+_SCRATCH = "/dev/shm/pdfxpert" if os.path.isdir("/dev/shm") else BASE_DIR
+UPLOAD_DIR = os.environ.get(
+    "PDFXPERT_UPLOAD_DIR", os.path.join(_SCRATCH, "uploads"))
+CONVERTED_DIR = os.environ.get(
+    "PDFXPERT_CONVERTED_DIR", os.path.join(_SCRATCH, "converted"))
 DB_PATH = os.path.join(BASE_DIR, "app.db")
 
+# RAM-backed scratch is finite; oldest files go first once the combined
+# size passes the limit.
+SCRATCH_LIMIT = int(os.environ.get("PDFXPERT_SCRATCH_LIMIT", 3 * 1024 ** 3))
+
 SECRET_KEY = "super-secret-key"
 
 for folder in (UPLOAD_DIR, CONVERTED_DIR):
     ensure_dir(folder)
 
+utils.start_eviction_thread((UPLOAD_DIR, CONVERTED_DIR), SCRATCH_LIMIT)
+
+# Conversion cache bookkeeping (see schema.sql); lets an eviction job
+# find stale entries by age.
+with sqlite3.connect(DB_PATH) as _db:
+    _db.execute(
+        """CREATE TABLE IF NOT EXISTS conversions (
+             digest TEXT PRIMARY KEY,
+             out_path TEXT NOT NULL,
+             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+           )"""
+    )
+
+class DiskBufferedRequest(Request):
+    # Spill every multipart part straight to a temp file (threshold 0)
+    # instead of Werkzeug's spooled buffer, which keeps small files in
+    # memory and copies large ones through an extra in-memory hop.
+    def _get_file_stream(self, total_content_length, content_type,
+                         filename=None, content_length=None):
+        return tempfile.TemporaryFile("rb+")
+
+
 app = Flask(__name__)
+app.request_class = DiskBufferedRequest
 app.config["SECRET_KEY"] = SECRET_KEY
 app.config["UPLOAD_FOLDER"] = UPLOAD_DIR
+app.config["MAX_CONTENT_LENGTH"] = 1024 * 1024 * 1024  # 1 GB
+
+# Memoize rendered pages that do not depend on request state, so repeat
+# hits skip Jinja rendering entirely.
+cache = Cache(app, config={"CACHE_TYPE": "SimpleCache"})
+
+# Compile every template once at boot and keep the compiled objects
+# pinned: no request pays Jinja's parse/compile on first hit, and with
+# auto-reload off render_template skips the per-request mtime stat.
+app.config["TEMPLATES_AUTO_RELOAD"] = False
+app.jinja_env.auto_reload = False
+for _name in app.jinja_env.list_templates():
+    app.jinja_env.get_template(_name)
+
+# Hand converted files to the front server instead of pumping their bytes
+# through the WSGI iterator in Python. With Apache mod_xsendfile set
+# PDFXPERT_X_SENDFILE=1; with nginx set PDFXPERT_ACCEL_PREFIX=/_downloads
+# and configure:
+#   location /_downloads/ { internal; alias <CONVERTED_DIR>/;
+#                           sendfile on; tcp_nopush on; }
+app.config["USE_X_SENDFILE"] = os.environ.get("PDFXPERT_X_SENDFILE") == "1"
+ACCEL_PREFIX = os.environ.get("PDFXPERT_ACCEL_PREFIX")
+
+
+def send_converted(path):
+    if ACCEL_PREFIX:
+        name = os.path.basename(path)
+        resp = make_response("")
+        resp.headers["X-Accel-Redirect"] = f"{ACCEL_PREFIX}/{name}"
+        resp.headers["Content-Type"] = "application/pdf"
+        resp.headers["Content-Disposition"] = f'attachment; filename="{name}"'
+        return resp
+
+    return send_file(path, as_attachment=True)
+
+# Pre-warm the LibreOffice worker pool so early conversions do not pay
+# the soffice bootstrap cost. If warm-up fails here (listener timeout, or
+# the soffice binary is missing entirely), workers are started lazily on
+# first use (or we fall back to one-shot soffice calls).
+if utils.HAVE_UNO:
+    try:
+        utils.get_office_pool().warm_up()
+    except (RuntimeError, OSError):
+        pass
 
 
 # ------------------------------------------
 # DATABASE CONNECTION
 # ------------------------------------------
+# One long-lived connection per worker thread instead of an open/close
+# pair around every request. WAL lets readers run alongside a writer and
+# survives process restarts; mmap keeps hot pages out of read syscalls.
+_db_local = threading.local()
+
+_DB_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY",
+)
+
+
 def get_db():
-    db = getattr(g, "_database", None)
+    db = getattr(_db_local, "conn", None)
     if db is None:
-        db = g._database = sqlite3.connect(DB_PATH)
+        db = sqlite3.connect(DB_PATH)
         db.row_factory = sqlite3.Row
+        for pragma in _DB_PRAGMAS:
+            db.execute(pragma)
+        _db_local.conn = db
     return db
 
 
-@app.teardown_appcontext
-def close_db(exception):
-    db = getattr(g, "_database", None)
-    if db:
-        db.close()
+# ------------------------------------------
+# CONVERSION CACHE
+# ------------------------------------------
+def record_conversion(digest, out_path):
+    db = get_db()
+    db.execute(
+        "INSERT OR REPLACE INTO conversions (digest, out_path) VALUES (?, ?)",
+        (digest, out_path),
+    )
+    db.commit()
+
+
+def cached_office_pdf(file):
+    """
+    Stream the upload and convert it, skipping LibreOffice entirely when
+    the same bytes were converted before (uploads are content-addressed,
+    so the digest doubles as the cache key).
+    """
+    save_path, digest = stream_to_upload(file, UPLOAD_DIR)
+    cached = os.path.join(CONVERTED_DIR, digest + ".pdf")
+
+    if not os.path.exists(cached):
+        output_file = convert_office_to_pdf(save_path, CONVERTED_DIR)
+        os.replace(output_file, cached)
+        record_conversion(digest, cached)
+
+    return cached
+
+
+# ------------------------------------------
+# PASSWORD VERIFICATION CACHE
+# ------------------------------------------
+# check_password_hash deliberately burns ~100 ms of CPU per verify, which
+# makes repeat logins the route's bottleneck under load. Successful
+# verifies are remembered by (user id, SHA-256 of the attempt) so they
+# become a dict lookup. Only digests of correct passwords are stored, and
+# entries self-invalidate when the stored hash changes.
+_VERIFY_CACHE = {}
+_VERIFY_CACHE_MAX = 1024
+
+
+def check_password_cached(user_id, stored_hash, pwd):
+    key = (user_id, hashlib.sha256(pwd.encode()).digest())
+    if _VERIFY_CACHE.get(key) == stored_hash:
+        return True
+
+    if check_password_hash(stored_hash, pwd):
+        if len(_VERIFY_CACHE) >= _VERIFY_CACHE_MAX:
+            _VERIFY_CACHE.pop(next(iter(_VERIFY_CACHE)))
+        _VERIFY_CACHE[key] = stored_hash
+        return True
+
+    return False
+
+
+# ------------------------------------------
+# UPLOAD TYPE CHECKS
+# ------------------------------------------
+# One shared extension check instead of the per-route
+# file.filename.lower().endswith((...)) chains.
+_ROUTE_EXTS = {
+    "word": frozenset({"docx"}),
+    "ppt": frozenset({"ppt", "pptx"}),
+    "image": frozenset({"jpg", "jpeg", "png"}),
+    "excel": frozenset({"xls", "xlsx"}),
+}
+
+
+def _ext_ok(filename, kind):
+    return filename.rpartition(".")[2].lower() in _ROUTE_EXTS[kind]
 
 
 # ------------------------------------------
@@ -96,11 +264,11 @@ def login():
 
         db = get_db()
         user = db.execute(
-            "SELECT * FROM users WHERE username = ?",
+            "SELECT id, password_hash FROM users WHERE username = ?",
             (uname,)
         ).fetchone()
 
-        if user and check_password_hash(user["password_hash"], pwd):
+        if user and check_password_cached(user["id"], user["password_hash"], pwd):
             session["user_id"] = user["id"]
             return redirect(url_for("dashboard"))
 
@@ -120,6 +288,7 @@ def logout():
 # ------------------------------------------
 @app.route("/")
 @login_required
+@cache.cached(timeout=60, key_prefix=lambda: f"dash_{session['user_id']}")
 def dashboard():
     return render_template("dashboard.html")
 
@@ -133,13 +302,8 @@ def convert_word():
     if request.method == "POST":
         file = request.files.get("file")
 
-        if file and file.filename.lower().endswith(".docx"):
-            filename = random_filename(file.filename)
-            save_path = os.path.join(UPLOAD_DIR, filename)
-            file.save(save_path)
-
-            output_file = convert_office_to_pdf(save_path, CONVERTED_DIR)
-            return send_file(output_file, as_attachment=True)
+        if file and _ext_ok(file.filename, "word"):
+            return send_converted(cached_office_pdf(file))
 
         flash("Upload a valid .docx file!", "danger")
 
@@ -155,13 +319,8 @@ def convert_ppt():
     if request.method == "POST":
         file = request.files.get("file")
 
-        if file and file.filename.lower().endswith((".ppt", ".pptx")):
-            filename = random_filename(file.filename)
-            save_path = os.path.join(UPLOAD_DIR, filename)
-            file.save(save_path)
-
-            output_file = convert_office_to_pdf(save_path, CONVERTED_DIR)
-            return send_file(output_file, as_attachment=True)
+        if file and _ext_ok(file.filename, "ppt"):
+            return send_converted(cached_office_pdf(file))
 
         flash("Upload a valid PPT or PPTX file!", "danger")
 
@@ -177,17 +336,16 @@ def convert_image():
     if request.method == "POST":
         file = request.files.get("file")
 
-        if file and file.filename.lower().endswith((".jpg", ".jpeg", ".png")):
-            filename = random_filename(file.filename)
-            save_path = os.path.join(UPLOAD_DIR, filename)
-            file.save(save_path)
+        if file and _ext_ok(file.filename, "image"):
+            save_path, digest = stream_to_upload(file, UPLOAD_DIR)
+            output_path = os.path.join(CONVERTED_DIR, digest + ".pdf")
 
-            output_path = os.path.join(CONVERTED_DIR, random_filename("image.pdf"))
+            if not os.path.exists(output_path):
+                from utils import image_to_pdf
+                image_to_pdf(save_path, output_path)
+                record_conversion(digest, output_path)
 
-            from utils import image_to_pdf
-            image_to_pdf(save_path, output_path)
-
-            return send_file(output_path, as_attachment=True)
+            return send_converted(output_path)
 
         flash("Upload a JPG, JPEG, or PNG image!", "danger")
 
@@ -203,13 +361,8 @@ def convert_excel():
     if request.method == "POST":
         file = request.files.get("file")
 
-        if file and file.filename.lower().endswith((".xls", ".xlsx")):
-            filename = random_filename(file.filename)
-            save_path = os.path.join(UPLOAD_DIR, filename)
-            file.save(save_path)
-
-            output_file = convert_office_to_pdf(save_path, CONVERTED_DIR)
-            return send_file(output_file, as_attachment=True)
+        if file and _ext_ok(file.filename, "excel"):
+            return send_converted(cached_office_pdf(file))
 
         flash("Upload a valid XLS or XLSX file!", "danger")
 
@@ -229,17 +382,26 @@ def merge():
             flash("Upload at least 2 PDFs", "danger")
             return redirect(url_for("merge"))
 
-        file_paths = []
-        for f in files:
-            fname = random_filename(f.filename)
-            path = os.path.join(UPLOAD_DIR, fname)
-            f.save(path)
-            file_paths.append(path)
+        file_paths = [
+            os.path.join(UPLOAD_DIR, random_filename(f.filename))
+            for f in files
+        ]
+
+        # Each upload already sits in its own parsed temp file, so the
+        # saves are independent and I/O-bound; overlap them instead of
+        # writing one file at a time.
+        with ThreadPoolExecutor(max_workers=min(8, len(files))) as pool:
+            futures = [
+                pool.submit(stream_to_disk, f, path)
+                for f, path in zip(files, file_paths)
+            ]
+            for future in futures:
+                future.result()
 
         output_path = os.path.join(CONVERTED_DIR, random_filename("merged.pdf"))
         merge_pdfs(file_paths, output_path)
 
-        return send_file(output_path, as_attachment=True)
+        return send_converted(output_path)
 
     return render_template("merge.html")
 
@@ -260,21 +422,14 @@ def split():
 
         filename = random_filename(pdf.filename)
         path = os.path.join(UPLOAD_DIR, filename)
-        pdf.save(path)
+        stream_to_disk(pdf, path)
 
-        page_list = []
-        for part in pages.split(","):
-            part = part.strip()
-            if "-" in part:
-                start, end = map(int, part.split("-"))
-                page_list.extend(range(start, end + 1))
-            else:
-                page_list.append(int(part))
+        page_list = parse_page_spec(pages)
 
         output_path = os.path.join(CONVERTED_DIR, random_filename("split.pdf"))
         split_pdf(path, page_list, output_path)
 
-        return send_file(output_path, as_attachment=True)
+        return send_converted(output_path)
 
     return render_template("split.html")
 
@@ -290,18 +445,20 @@ def split():
 # ------------------------------------------
 @app.route("/unlock")
 @login_required
+@cache.cached(timeout=3600)
 def unlock():
     return render_template("unlock.html")
 
 
 @app.route("/ocr")
 @login_required
+@cache.cached(timeout=3600)
 def ocr():
     return render_template("ocr.html")
 
 
 # ------------------------------------------
-# RUN APP
+# RUN APP (development only — use wsgi.py + gunicorn in production)
 # ------------------------------------------
 if __name__ == "__main__":
     app.run(debug=True)
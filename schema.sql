@@ -4,3 +4,9 @@ CREATE TABLE IF NOT EXISTS users (
   password_hash TEXT NOT NULL,
   email TEXT
 );
+
+CREATE TABLE IF NOT EXISTS conversions (
+  digest TEXT PRIMARY KEY,
+  out_path TEXT NOT NULL,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -1,12 +1,34 @@
+import binascii
+import hashlib
 import os
+import queue
+import shutil
+import socket
 import subprocess
-import uuid
-from PIL import Image
-from pypdf import PdfReader, PdfWriter
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
+# PIL and pypdf are imported inside the functions that need them: they
+# cost tens of MB of RSS and ~100 ms of import per worker, which
+# login-only traffic should never pay (and fork-based servers share more
+# pages when the parent never loads them).
 
-# Allowed upload extensions
-ALLOWED_IN = {'.doc', '.docx', '.ppt', '.pptx', '.xls', '.xlsx', '.pdf', '.jpg', '.jpeg', '.png'}
+# UNO bridge (ships with LibreOffice's python). When unavailable we fall
+# back to one-shot soffice invocations.
+try:
+    import uno
+    from com.sun.star.beans import PropertyValue
+    HAVE_UNO = True
+except ImportError:
+    HAVE_UNO = False
+
+
+# Allowed upload extensions (dotless; matched via rpartition in allowed_file)
+_ALLOWED = frozenset(
+    {'doc', 'docx', 'ppt', 'pptx', 'xls', 'xlsx', 'pdf', 'jpg', 'jpeg', 'png'}
+)
 
 
 # -----------------------------
@@ -16,79 +38,509 @@ def ensure_dir(path):
     os.makedirs(path, exist_ok=True)
 
 
-def random_filename(filename: str) -> str:
-    ext = os.path.splitext(filename)[1]
-    return f"{uuid.uuid4().hex}{ext}"
+def random_filename(filename: str, _hex=binascii.hexlify, _rand=os.urandom) -> str:
+    # os.urandom + hexlify stay at C level; uuid4 builds a UUID object
+    # with pure-Python version/variant bit-fiddling. Called on every
+    # upload. The extension only counts when the dot sits after any path
+    # separator and is not the basename's first char, matching splitext:
+    # client-sent names like "a.b/c" or ".pdf" must not leak separators
+    # or dot-files into the generated name.
+    slash = max(filename.rfind("/"), filename.rfind("\\"))
+    dot = filename.rfind(".")
+    ext = filename[dot:] if dot > slash + 1 else ""
+    return _hex(_rand(16)).decode("ascii") + ext
+
+
+def stream_to_disk(werkzeug_file, dst: str, chunk: int = 1 << 20):
+    """
+    Copy an uploaded file to dst in fixed-size chunks.
+
+    Reads straight from the upload stream instead of file.save(), so peak
+    memory stays at one chunk regardless of upload size.
+    """
+    with open(dst, "wb") as f:
+        while True:
+            block = werkzeug_file.stream.read(chunk)
+            if not block:
+                break
+            f.write(block)
+
+
+def stream_to_upload(werkzeug_file, upload_dir: str, chunk: int = 1 << 20):
+    """
+    Stream an upload into upload_dir under a content-addressed name.
+
+    Each chunk is hashed as it is written (SHA-256 uses the CPU's SHA
+    extensions where available, so this rides along with the copy), then
+    the file is atomically renamed to <digest><ext>. Identical uploads
+    land on the same path, letting callers reuse converted output.
+    Returns (path, digest).
+    """
+    ext = os.path.splitext(werkzeug_file.filename)[1].lower()
+    h = hashlib.sha256()
+    tmp_path = os.path.join(upload_dir, random_filename("tmp.part"))
+
+    with open(tmp_path, "wb") as f:
+        while True:
+            block = werkzeug_file.stream.read(chunk)
+            if not block:
+                break
+            h.update(block)
+            f.write(block)
+
+    digest = h.hexdigest()
+    path = os.path.join(upload_dir, digest + ext)
+    os.replace(tmp_path, path)
+    return path, digest
+
+
+def evict_oldest(dirs, max_bytes: int):
+    """
+    Delete the oldest files across dirs until their combined size fits
+    max_bytes. Keeps RAM-backed scratch directories bounded.
+    """
+    entries = []
+    total = 0
+    for d in dirs:
+        for name in os.listdir(d):
+            path = os.path.join(d, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+def start_eviction_thread(dirs, max_bytes: int, interval: int = 60):
+    def loop():
+        while True:
+            evict_oldest(dirs, max_bytes)
+            time.sleep(interval)
+
+    thread = threading.Thread(target=loop, daemon=True)
+    thread.start()
+    return thread
 
 
 # -----------------------------
 # OFFICE → PDF (LibreOffice)
 # -----------------------------
-def convert_office_to_pdf(input_path: str, output_dir: str) -> str:
-    ensure_dir(output_dir)
+if os.name == "nt":
+    _SOFFICE_DEFAULT = r"C:\\Program Files\\LibreOffice\\program\\soffice.exe"
+else:
+    _SOFFICE_DEFAULT = shutil.which("soffice") or "soffice"
+
+SOFFICE_BIN = os.environ.get("SOFFICE_BIN", _SOFFICE_DEFAULT)
+
+# Export filter per input type (writer is the default).
+_PDF_FILTERS = {
+    '.ppt': 'impress_pdf_Export',
+    '.pptx': 'impress_pdf_Export',
+    '.xls': 'calc_pdf_Export',
+    '.xlsx': 'calc_pdf_Export',
+}
+
+
+def _pdf_filter_for(input_path: str) -> str:
+    ext = os.path.splitext(input_path)[1].lower()
+    return _PDF_FILTERS.get(ext, 'writer_pdf_Export')
+
+
+def _make_prop(name, value):
+    prop = PropertyValue()
+    prop.Name = name
+    prop.Value = value
+    return prop
+
+
+def _free_port() -> int:
+    # Let the kernel pick an unused port. A parallel process could grab
+    # it before soffice binds, but distinct processes draw from the whole
+    # ephemeral range, unlike a fixed base port that collides every time.
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class LibreOfficeListener:
+    """
+    Long-lived headless soffice process driven over the UNO bridge.
+
+    Spawning soffice per conversion pays its 1-3 s bootstrap every time;
+    keeping one listener alive means each conversion only pays document
+    parsing time. Each listener gets its own user profile so several can
+    run in parallel safely.
+    """
+
+    def __init__(self, host="127.0.0.1", port=None, profile_dir=None):
+        self.host = host
+        self.port = port or _free_port()
+        # The pid keeps profiles distinct across gunicorn workers even if
+        # two processes ever draw the same port number.
+        self.profile_dir = profile_dir or os.path.join(
+            tempfile.gettempdir(), f"lo_profile_{os.getpid()}_{self.port}"
+        )
+        self.process = None
+
+    def start(self):
+        ensure_dir(self.profile_dir)
+        accept = (
+            f"socket,host={self.host},port={self.port};"
+            "urp;StarOffice.ServiceManager"
+        )
+        profile_url = "file:///" + os.path.abspath(self.profile_dir).replace("\\", "/").lstrip("/")
+        cmd = [
+            SOFFICE_BIN,
+            "--headless",
+            "--nologo",
+            "--norestore",
+            "--nofirststartwizard",
+            f"--accept={accept}",
+            f"-env:UserInstallation={profile_url}",
+        ]
+        self.process = subprocess.Popen(
+            cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        self._wait_ready()
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+            self.process = None
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def ensure_running(self):
+        if not self.is_alive():
+            self.stop()
+            self.start()
+
+    def _connect(self):
+        local_ctx = uno.getComponentContext()
+        resolver = local_ctx.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", local_ctx
+        )
+        ctx = resolver.resolve(
+            f"uno:socket,host={self.host},port={self.port};"
+            "urp;StarOffice.ComponentContext"
+        )
+        return ctx.ServiceManager.createInstanceWithContext(
+            "com.sun.star.frame.Desktop", ctx
+        )
+
+    def _wait_ready(self, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                self._connect()
+                return
+            except Exception:
+                time.sleep(0.25)
+        self.stop()
+        raise RuntimeError("LibreOffice listener did not come up in time")
+
+    def convert(self, input_path: str, output_dir: str) -> str:
+        self.ensure_running()
+        desktop = self._connect()
+
+        base = os.path.splitext(os.path.basename(input_path))[0]
+        output_file = os.path.join(output_dir, base + ".pdf")
+
+        in_url = uno.systemPathToFileUrl(os.path.abspath(input_path))
+        out_url = uno.systemPathToFileUrl(os.path.abspath(output_file))
+
+        doc = desktop.loadComponentFromURL(
+            in_url, "_blank", 0, (_make_prop("Hidden", True),)
+        )
+        if doc is None:
+            raise RuntimeError(f"LibreOffice could not open {input_path}")
+
+        try:
+            doc.storeToURL(
+                out_url,
+                (_make_prop("FilterName", _pdf_filter_for(input_path)),),
+            )
+        finally:
+            doc.close(True)
+
+        if not os.path.exists(output_file):
+            raise RuntimeError("Converted PDF not found!")
+
+        return output_file
+
+
+class LibreOfficePool:
+    """
+    Bounded pool of soffice listeners for parallel conversions.
+
+    LibreOffice is not multi-instance safe with a shared profile, so a
+    single listener serializes concurrent uploads. Each worker here gets
+    its own UNO port and -env:UserInstallation profile; jobs check out an
+    idle worker, convert, and return it. A watchdog kills a worker that
+    hangs past the job timeout (a known soffice failure mode) and the
+    next checkout respawns it.
+    """
 
+    def __init__(self, size=None, job_timeout=120):
+        self.size = size or os.cpu_count() or 2
+        self.job_timeout = job_timeout
+        self._idle = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=self.size)
+        # Each listener probes its own free port, so pools in separate
+        # gunicorn workers never contend for a fixed port range.
+        for _ in range(self.size):
+            self._idle.put(LibreOfficeListener())
+
+    def warm_up(self):
+        # Start every listener now so the first N conversions do not pay
+        # the soffice bootstrap cost.
+        listeners = [self._idle.get() for _ in range(self.size)]
+        try:
+            for listener in listeners:
+                listener.ensure_running()
+        finally:
+            for listener in listeners:
+                self._idle.put(listener)
+
+    def submit(self, input_path: str, output_dir: str):
+        return self._executor.submit(self._convert_job, input_path, output_dir)
+
+    def convert(self, input_path: str, output_dir: str) -> str:
+        return self.submit(input_path, output_dir).result()
+
+    def _convert_job(self, input_path: str, output_dir: str) -> str:
+        listener = self._idle.get()
+        # Killing the process makes a hung UNO call fail fast; the worker
+        # is respawned by ensure_running on its next checkout.
+        watchdog = threading.Timer(self.job_timeout, listener.stop)
+        watchdog.start()
+        try:
+            return listener.convert(input_path, output_dir)
+        finally:
+            watchdog.cancel()
+            self._idle.put(listener)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+        while not self._idle.empty():
+            self._idle.get_nowait().stop()
+
+
+_pool = None
+
+
+def get_office_pool() -> LibreOfficePool:
+    global _pool
+    if _pool is None:
+        _pool = LibreOfficePool()
+    return _pool
+
+
+def _convert_with_soffice_cli(input_paths: list, output_dir: str,
+                              timeout: int = 120) -> list:
+    # All inputs go to one soffice invocation: the files convert serially
+    # inside it, but the 1-3 s bootstrap is paid once per batch instead
+    # of once per file.
     cmd = [
-        r"C:\\Program Files\\LibreOffice\\program\\soffice.exe",
+        SOFFICE_BIN,
         "--headless",
         "--convert-to", "pdf",
         "--outdir", output_dir,
-        input_path,
+        *input_paths,
     ]
 
-    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    # soffice chatters on stdout; dropping it avoids allocating a pipe
+    # and buffering output nobody reads. stderr is kept, but only the
+    # tail ever reaches an error message. The timeout guards against
+    # LibreOffice's known hang mode.
+    deadline = timeout * len(input_paths)
+    try:
+        proc = subprocess.run(
+            cmd,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            timeout=deadline,
+        )
+    except subprocess.TimeoutExpired:
+        raise RuntimeError(f"LibreOffice conversion timed out after {deadline}s")
 
     if proc.returncode != 0:
-        raise RuntimeError(f"LibreOffice conversion failed: {proc.stderr.decode()}")
+        err = proc.stderr[-2048:].decode(errors="replace")
+        raise RuntimeError(f"LibreOffice conversion failed: {err}")
+
+    output_files = []
+    for input_path in input_paths:
+        base = os.path.splitext(os.path.basename(input_path))[0]
+        output_file = os.path.join(output_dir, base + ".pdf")
+
+        if not os.path.exists(output_file):
+            raise RuntimeError("Converted PDF not found!")
+
+        output_files.append(output_file)
+
+    return output_files
 
-    base = os.path.splitext(os.path.basename(input_path))[0]
-    output_file = os.path.join(output_dir, base + ".pdf")
 
-    if not os.path.exists(output_file):
-        raise RuntimeError("Converted PDF not found!")
+def convert_office_to_pdf(input_path, output_dir: str):
+    """
+    Convert one Office document, or a list of them, to PDF.
+
+    Returns the output path for a single input, or the list of output
+    paths (in input order) for a batch.
+    """
+    ensure_dir(output_dir)
 
-    return output_file
+    if isinstance(input_path, (list, tuple)):
+        if HAVE_UNO:
+            pool = get_office_pool()
+            futures = [pool.submit(p, output_dir) for p in input_path]
+            return [f.result() for f in futures]
+        return _convert_with_soffice_cli(list(input_path), output_dir)
+
+    if HAVE_UNO:
+        return get_office_pool().convert(input_path, output_dir)
+
+    return _convert_with_soffice_cli([input_path], output_dir)[0]
 
 
 # -----------------------------
 # Image → PDF
 # -----------------------------
 def image_to_pdf(input_path: str, output_path: str):
+    from PIL import Image
+
     img = Image.open(input_path)
 
     # Convert RGBA → RGB
     if img.mode in ("RGBA", "P"):
         img = img.convert("RGB")
 
-    img.save(output_path, "PDF", resolution=100)
+    # Baseline JPEG with optimize/progressive off keeps the encoder on
+    # its single-pass fast path, which is SIMD-vectorized when Pillow is
+    # built against libjpeg-turbo (e.g. the pillow-simd wheel).
+    img.save(
+        output_path, "PDF", resolution=100,
+        quality=85, optimize=False, progressive=False,
+    )
 
 
 # -----------------------------
 # PDF Merge
 # -----------------------------
 def merge_pdfs(file_paths: list, out_path: str):
+    from pypdf import PdfWriter
+
     writer = PdfWriter()
 
+    # append() is pypdf's bulk path: it clones each document's object
+    # graph in one pass instead of re-serializing every page (and every
+    # shared font/image) through add_page.
     for fp in file_paths:
-        reader = PdfReader(fp)
-        for page in reader.pages:
-            writer.add_page(page)
+        writer.append(fp)
 
     with open(out_path, "wb") as f:
         writer.write(f)
 
 
+# -----------------------------
+# Page spec parsing
+# -----------------------------
+def parse_page_spec(spec: str) -> list:
+    """
+    Parse a page spec like "1,3,5-12" into a list of page numbers.
+
+    One scan over the string with a tiny digit/'-'/',' state machine;
+    no per-token split/strip allocations, and ranges expand through a
+    single list.extend(range(...)).
+    """
+    pages = []
+    num = 0
+    have_num = False
+    num_ended = False
+    start = None
+
+    for ch in spec + ",":
+        if "0" <= ch <= "9":
+            # Whitespace ends a number: "1 2" is malformed, not page 12.
+            if num_ended:
+                raise ValueError(f"Invalid page spec: {spec!r}")
+            num = num * 10 + (ord(ch) - 48)
+            have_num = True
+        elif ch == "-" and have_num:
+            # A second dash in a segment ("1-2-3") is malformed, not a
+            # new range start.
+            if start is not None:
+                raise ValueError(f"Invalid page spec: {spec!r}")
+            start = num
+            num = 0
+            have_num = False
+            num_ended = False
+        elif ch == ",":
+            if start is not None:
+                # A dangling dash ("5-") has no range end.
+                if not have_num:
+                    raise ValueError(f"Invalid page spec: {spec!r}")
+                pages.extend(range(start, num + 1))
+            elif have_num:
+                pages.append(num)
+            start = None
+            num = 0
+            have_num = False
+            num_ended = False
+        elif ch.isspace():
+            if have_num:
+                num_ended = True
+        else:
+            raise ValueError(f"Invalid page spec: {spec!r}")
+
+    return pages
+
+
+# Warm the parser once at import so the first /split request pays no
+# first-call cost. This call is also the hook point should the numeric
+# helpers here ever move to a JIT (numba @njit(cache=True) compiles on
+# first execution); no other function in this module is numeric.
+parse_page_spec("1-2,4")
+
+
 # -----------------------------
 # PDF Split
 # -----------------------------
 def split_pdf(pdf_path: str, pages: list, out_path: str):
+    from pypdf import PdfReader, PdfWriter
+
     reader = PdfReader(pdf_path)
-    writer = PdfWriter()
+    n_pages = len(reader.pages)
 
+    indices = []
     for p in pages:
         idx = p - 1
-        if idx < 0 or idx >= len(reader.pages):
+        if idx < 0 or idx >= n_pages:
             raise IndexError("Page index out of range")
-        writer.add_page(reader.pages[idx])
+        indices.append(idx)
+
+    writer = PdfWriter()
+
+    # append's bulk path clones the source object graph once, so fonts
+    # and images shared between the selected pages are copied a single
+    # time instead of once per add_page.
+    writer.append(reader, pages=indices)
 
     with open(out_path, "wb") as f:
         writer.write(f)
@@ -98,8 +550,9 @@ def split_pdf(pdf_path: str, pages: list, out_path: str):
 # File type checker
 # -----------------------------
 def allowed_file(filename: str) -> bool:
-    ext = os.path.splitext(filename)[1].lower()
-    return ext in ALLOWED_IN
+    # rpartition is one C call; splitext scans with leading-dot special
+    # cases we never hit on upload names.
+    return filename.rpartition('.')[2].lower() in _ALLOWED
 
 
 # -----------------------------
@@ -108,25 +561,28 @@ def allowed_file(filename: str) -> bool:
 def compress_pdf(input_path, output_path, quality="medium"):
     """
     Compress PDF using content stream compression.
-    quality = low, medium, high (affects image compression)
+    quality = low, medium, high (trades deflate effort for output size)
     """
+    from pypdf import PdfWriter
 
-    reader = PdfReader(input_path)
-    writer = PdfWriter()
-
-    # Compression map
+    # zlib level per quality tier. The old default (level 9) spends most
+    # of its time squeezing the last couple of percent; level 6 sits on
+    # the knee of the deflate effort/ratio curve.
     quality_map = {
-        "low": 50,
-        "medium": 70,
-        "high": 85
+        "low": 1,
+        "medium": 6,
+        "high": 9,
     }
 
-    jpeg_quality = quality_map.get(quality, 70)
+    level = quality_map.get(quality, 6)
+
+    # Clone the whole object graph once (same bulk path as merge), then
+    # recompress each page's streams in place - one pass over the pages
+    # instead of a compress loop followed by per-page add_page copies.
+    writer = PdfWriter(clone_from=input_path)
 
-    for page in reader.pages:
-        page.compress_content_streams()
-        writer.add_page(page)
+    for page in writer.pages:
+        page.compress_content_streams(level=level)
 
-    # Write out
     with open(output_path, "wb") as f:
         writer.write(f)
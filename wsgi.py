@@ -0,0 +1,17 @@
+"""
+WSGI entry point for production serving.
+
+The Werkzeug dev server (`python app.py`) is single-threaded, so every
+conversion request serializes behind one process. Run this module under
+gunicorn with threaded workers instead:
+
+    gunicorn wsgi:app -k gthread -w 4 --threads 8 -t 300 \
+        --max-requests 1000 --max-requests-jitter 100 \
+        --worker-tmp-dir /dev/shm
+
+Match -w to the number of cores; each worker warms its own LibreOffice
+pool, so total soffice processes are workers x pool size.
+"""
+from app import app
+
+__all__ = ["app"]